@@ -4,13 +4,26 @@ import os
 import sys
 import subprocess
 import threading
+import weakref
 import time
 import signal
 import argparse
-from datetime import datetime
+import random
+import queue
+import bisect
+import ctypes
+import select
+import selectors
+import socket
+import struct
 import logging
+import logging.handlers
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.observers.polling import PollingObserver
+from watchdog.events import (
+    FileSystemEventHandler, FileClosedEvent, FileCreatedEvent,
+    FileDeletedEvent,
+)
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -20,22 +33,333 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+MKV_SUFFIXES = (".mkv", ".MKV")
+MKV_SUFFIXES_B = (b".mkv", b".MKV")  # inotify事件中的原始文件名
+FFMPEG_LOG_BACKUPS = 3  # FFmpeg日志轮转保留的旧文件数
+RESTART_MIN_UPTIME = 30  # FFmpeg运行超过该秒数则重置重启退避
+OBSERVER_JOIN_TIMEOUT = 2  # 网络挂载上监控线程可能卡在系统调用中
+SEGMENT_LIST = "segments.csv"  # FFmpeg写出的已完成分片列表
+THREAD_PRIORITY_BELOW_NORMAL = -1
+PROCESS_SET_INFORMATION = 0x0200
+PROCESS_QUERY_INFORMATION = 0x0400
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs"}
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class InotifyObserver(threading.Thread):
+    """基于inotify + epoll的文件监控（仅Linux），接口与watchdog的Observer一致
+
+    只订阅创建、写入完成、删除和移入/移出事件，
+    停止信号通过eventfd与inotify一同由epoll等待，空闲时不会唤醒。
+    """
+
+    WATCH_MASK = (
+        IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM
+    )
+
+    def __init__(self, suffixes=MKV_SUFFIXES_B):
+        super().__init__(daemon=True)
+        self.suffixes = suffixes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._stop_fd = None
+        self._epoll = None
+        try:
+            # os.eventfd需要Python 3.10+，失败时由调用方回退至watchdog
+            self._stop_fd = os.eventfd(0, os.EFD_CLOEXEC | os.EFD_NONBLOCK)
+            self._epoll = select.epoll()
+            self._epoll.register(self._fd, select.EPOLLIN)
+            self._epoll.register(self._stop_fd, select.EPOLLIN)
+        except BaseException:
+            # 回退前关闭已打开的fd，避免每次初始化失败都泄漏
+            if self._epoll is not None:
+                self._epoll.close()
+            if self._stop_fd is not None:
+                os.close(self._stop_fd)
+            os.close(self._fd)
+            raise
+        self._lock = threading.Lock()
+        self._watches = {}  # wd -> (目录, 事件处理器列表)
+
+    def schedule(self, event_handler, path, recursive=False):
+        """添加目录监控（不支持递归）"""
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), self.WATCH_MASK
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._watches.setdefault(wd, (path, []))[1].append(event_handler)
+
+    def stop(self):
+        """通知监控线程退出"""
+        with self._lock:
+            if self._stop_fd is not None:
+                os.eventfd_write(self._stop_fd, 1)
+
+    def run(self):
+        try:
+            while True:
+                for fd, _ in self._epoll.poll():
+                    if fd == self._stop_fd:
+                        return
+                    self._read_events()
+        finally:
+            with self._lock:
+                self._epoll.close()
+                os.close(self._fd)
+                os.close(self._stop_fd)
+                self._stop_fd = None
+
+    def _read_events(self):
+        """读取并分发inotify事件"""
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buf, offset)
+            offset += INOTIFY_EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("inotify事件队列溢出，部分事件已丢失")
+                self._notify_overflow()
+                continue
+            if mask & IN_ISDIR or not name.endswith(self.suffixes):
+                continue
+
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            path, handlers = watch
+            filepath = os.path.join(path, os.fsdecode(name))
+            if mask & IN_CREATE:
+                event = FileCreatedEvent(filepath)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                event = FileDeletedEvent(filepath)
+            else:
+                # 移入的文件同样视为写入完成
+                event = FileClosedEvent(filepath)
+            for handler in handlers:
+                try:
+                    handler.dispatch(event)
+                except Exception as e:
+                    logging.error(f"文件事件处理失败: {str(e)}")
+
+    def _notify_overflow(self):
+        """通知所有事件处理器有事件丢失（处理器可实现on_overflow）"""
+        for _, handlers in list(self._watches.values()):
+            for handler in handlers:
+                on_overflow = getattr(handler, "on_overflow", None)
+                if on_overflow is None:
+                    continue
+                try:
+                    on_overflow()
+                except Exception as e:
+                    logging.error(f"文件事件处理失败: {str(e)}")
+
+def is_network_fs(path):
+    """根据/proc/self/mountinfo判断路径是否位于网络文件系统上"""
+    path = os.path.realpath(path)
+    best_mount, best_type = "", None
+    try:
+        with open("/proc/self/mountinfo") as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[4].replace("\\040", " ")
+                prefix = mount_point.rstrip("/") + "/"
+                if path != mount_point and not path.startswith(prefix):
+                    continue
+                # 取最长匹配的挂载点，同一挂载点以后出现者为准
+                if len(mount_point) >= len(best_mount):
+                    best_mount = mount_point
+                    best_type = fields[fields.index("-") + 1]
+    except (OSError, ValueError, IndexError):
+        return False
+    return best_type in NETWORK_FS_TYPES
+
+def drop_page_cache(filepath):
+    """通知内核不再需要该文件的页缓存（仅支持posix_fadvise的平台）"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # DONTNEED会跳过脏页，先写回才能释放整个分片
+        if hasattr(os, "fdatasync"):
+            os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class PageCacheDropper(threading.Thread):
+    """低优先级线程：写回已完成分片并释放其页缓存，不占用监控线程"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._queue = queue.Queue()
+
+    def submit(self, filepath):
+        self._queue.put(filepath)
+
+    def stop(self):
+        self._queue.put(None)
+
+    def run(self):
+        lower_thread_priority()
+        while True:
+            filepath = self._queue.get()
+            if filepath is None:
+                break
+            drop_page_cache(filepath)
+
+def lower_thread_priority():
+    """降低当前线程的调度优先级，避免与监控线程争抢CPU"""
+    try:
+        if sys.platform.startswith("linux"):
+            # Linux下nice值按线程生效
+            tid = threading.get_native_id()
+            nice = os.getpriority(os.PRIO_PROCESS, tid)
+            os.setpriority(os.PRIO_PROCESS, tid, min(nice + 10, 19))
+        elif sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(
+                kernel32.GetCurrentThread(), THREAD_PRIORITY_BELOW_NORMAL
+            )
+    except (AttributeError, OSError) as e:
+        logging.warning(f"无法降低线程优先级: {str(e)}")
+
+def shutdown_observer(observer, cache_dropper):
+    """停止文件监控线程，最多等待OBSERVER_JOIN_TIMEOUT秒"""
+    observer.stop()
+    cache_dropper.stop()
+    observer.join(timeout=OBSERVER_JOIN_TIMEOUT)
+    if observer.is_alive():
+        logging.warning("文件监控线程未能及时退出")
+
+def available_cpus():
+    """当前进程可使用的CPU集合"""
+    if hasattr(os, "sched_getaffinity"):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count() or 1))
+
+def set_cpu_affinity(pid, cpus):
+    """设置进程可运行的CPU集合（pid为0表示当前进程）"""
+    if hasattr(os, "sched_setaffinity"):
+        if pid == 0:
+            # Linux下只作用于调用线程，之后创建的线程继承该设置
+            os.sched_setaffinity(0, cpus)
+            return
+        # sched_setaffinity(pid)只作用于主线程，子进程启动后已创建的线程
+        # 仍继承旧的亲和性，需逐个设置；反复扫描直到没有新线程出现
+        done = set()
+        while True:
+            try:
+                tids = {int(tid) for tid in os.listdir(f"/proc/{pid}/task")}
+            except FileNotFoundError:
+                tids = {pid}
+            pending = tids - done
+            if not pending:
+                return
+            for tid in pending:
+                try:
+                    os.sched_setaffinity(tid, cpus)
+                except ProcessLookupError:
+                    pass
+            done |= pending
+    elif sys.platform == "win32":
+        kernel32 = ctypes.windll.kernel32
+        if pid == 0:
+            handle = kernel32.GetCurrentProcess()
+        else:
+            handle = kernel32.OpenProcess(
+                PROCESS_SET_INFORMATION | PROCESS_QUERY_INFORMATION, False, pid
+            )
+            if not handle:
+                raise ctypes.WinError()
+        try:
+            mask = sum(1 << cpu for cpu in cpus)
+            if not kernel32.SetProcessAffinityMask(handle, ctypes.c_size_t(mask)):
+                raise ctypes.WinError()
+        finally:
+            if pid != 0:
+                kernel32.CloseHandle(handle)
+
+class SegmentListReader:
+    """增量读取FFmpeg写出的CSV分片列表（每行: 文件名,开始时间,结束时间）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pending = ""
+
+    def read_finished(self):
+        """返回自上次读取以来新完成的分片文件名"""
+        if self._file is None:
+            try:
+                self._file = open(self.path, "r", newline="")
+            except FileNotFoundError:
+                return []
+
+        data = self._file.read()
+        if not data:
+            return []
+        lines = (self._pending + data).split("\n")
+        # 最后一段可能是尚未写完的行
+        self._pending = lines.pop()
+        return [line.split(",", 2)[0] for line in lines if line]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 class FileEventHandler(FileSystemEventHandler):
     def __init__(self, recorder):
         super().__init__()
-        self.recorder = recorder
+        # 弱引用，监控线程不会使录制器无法被回收
+        self.recorder = weakref.ref(recorder)
+        self.cache_dropper = recorder.cache_dropper
         self.last_file = None
 
+    def on_created(self, event):
+        """处理文件创建事件，以FFmpeg实际创建的文件为当前分片"""
+        if event.is_directory or not event.src_path.endswith(MKV_SUFFIXES):
+            return
+
+        current_file = event.src_path
+        if not os.path.isabs(current_file):
+            current_file = os.path.normpath(current_file)
+        recorder = self.recorder()
+        if recorder is not None and current_file != self.last_file:
+            self.last_file = current_file
+            recorder.switch_file(current_file)
+            logging.info("检测到新分片文件: %s", current_file)
+
     def on_closed(self, event):
-        """处理文件关闭事件（Windows兼容）"""
-        if not event.is_directory and event.src_path.lower().endswith(".mkv"):
-            current_file = os.path.normpath(event.src_path)
-            if current_file != self.last_file:
-                with self.recorder.lock:
-                    self.recorder.current_file = current_file
-                    self.recorder.last_check_time = time.time()
-                    self.last_file = current_file
-                logging.info(f"检测到新分片文件: {current_file}")
+        """分片写入完成后不会再被读取，释放其页缓存"""
+        if not event.is_directory and event.src_path.endswith(MKV_SUFFIXES):
+            # fdatasync可能耗时较长，交给低优先级线程，避免推迟后续事件
+            self.cache_dropper.submit(event.src_path)
 
 class FFmpegRecorder:
     def __init__(self, args):
@@ -44,14 +368,110 @@ class FFmpegRecorder:
         self.current_file = None
         self.stop_event = threading.Event()
         self.restart_event = threading.Event()
-        self.lock = threading.Lock()
-        self.last_check_time = time.time()
-        self.last_size = 0
+        # 唤醒录制主循环的自管道（socketpair以兼容Windows下的select）
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        # (最近一次检测到写入的单调时间, 文件大小)，整体替换以保证一致
+        self.check_state = (time.monotonic(), 0)
+        self.segment_list = os.path.join(args.output_dir, SEGMENT_LIST)
+        self.cmd = self._build_command()
+        self.ffmpeg_cpus = self._init_cpu_affinity()
+        self.ffmpeg_logger = self._init_ffmpeg_logger()
         self._init_file_watcher()
 
+    def _init_ffmpeg_logger(self):
+        """FFmpeg输出日志：指定文件时按大小轮转，否则并入本程序日志"""
+        logger = logging.getLogger("ffmpeg")
+        if self.args.ffmpeg_log:
+            handler = logging.handlers.RotatingFileHandler(
+                self.args.ffmpeg_log,
+                maxBytes=self.args.ffmpeg_log_size,
+                backupCount=FFMPEG_LOG_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            logger.propagate = False
+        return logger
+
+    def _drain_stderr(self, pipe):
+        """持续读取FFmpeg的stderr并写入日志"""
+        pending = b""
+        with pipe:
+            while True:
+                chunk = pipe.read1(65536)
+                if not chunk:
+                    break
+                # 统计信息行以\r结尾，同样按行切分
+                lines = (pending + chunk).replace(b"\r", b"\n").split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line:
+                        self.ffmpeg_logger.info(line.decode(errors="replace"))
+        if pending:
+            self.ffmpeg_logger.info(pending.decode(errors="replace"))
+
+    def _init_cpu_affinity(self):
+        """将Python线程固定在一个核心上，返回留给FFmpeg的CPU集合
+
+        必须在创建其他线程之前调用，使监控、清理线程继承该设置。
+        """
+        if not self.args.pin_cpu:
+            return None
+        cpus = available_cpus()
+        if len(cpus) < 2:
+            return None
+        python_cpu = min(cpus)
+        try:
+            set_cpu_affinity(0, {python_cpu})
+        except (OSError, AttributeError) as e:
+            logging.warning(f"无法设置CPU亲和性: {str(e)}")
+            return None
+        logging.info(f"Python固定于CPU {python_cpu}，FFmpeg使用其余{len(cpus) - 1}个核心")
+        return cpus - {python_cpu}
+
+    def _build_command(self):
+        """构建FFmpeg命令行（参数不变，每次重启复用）"""
+        cmd = [self.args.ffmpeg_path, "-hide_banner"]
+        if self.args.nostats:
+            cmd.append("-nostats")
+        cmd += [
+            "-rtsp_transport", self.args.rtsp_transport,
+            "-i", self.args.rtsp_url,
+            "-c", "copy",
+            "-f", "segment", "-reset_timestamps", "1", "-strftime", "1",
+            "-segment_time", str(self.args.segment_duration),
+            "-segment_format", "mkv",
+            "-segment_list", self.segment_list, "-segment_list_type", "csv",
+            os.path.join(self.args.output_dir, "%Y-%m-%d_%H-%M-%S.mkv"),
+        ]
+        return cmd
+
     def _init_file_watcher(self):
         """初始化文件监控"""
-        self.observer = Observer()
+        fs_watcher = self.args.fs_watcher
+        if fs_watcher == "auto":
+            # 网络文件系统上inotify收不到远端写入事件
+            if is_network_fs(self.args.output_dir):
+                fs_watcher = "polling"
+            else:
+                fs_watcher = "inotify"
+            logging.info(f"文件监控方式: {fs_watcher}")
+
+        if fs_watcher == "polling":
+            self.observer = PollingObserver(timeout=self.args.monitor_interval)
+        elif sys.platform.startswith("linux"):
+            try:
+                self.observer = InotifyObserver()
+            except (OSError, AttributeError) as e:
+                logging.warning(f"无法使用inotify，回退至watchdog: {str(e)}")
+                self.observer = Observer()
+        else:
+            # Windows下watchdog本身即基于ReadDirectoryChangesW
+            self.observer = Observer()
+        self.cache_dropper = PageCacheDropper()
+        self.cache_dropper.start()
         event_handler = FileEventHandler(self)
         self.observer.schedule(
             event_handler,
@@ -59,151 +479,278 @@ class FFmpegRecorder:
             recursive=False,
         )
         self.observer.start()
+        # 不引用self，避免阻止回收；解释器退出时同样会执行
+        self._finalizer = weakref.finalize(
+            self, shutdown_observer, self.observer, self.cache_dropper
+        )
 
     def find_latest_mkv(self):
         """查找目录中最新的mkv文件"""
-        output_dir = self.args.output_dir
         latest_file = None
         latest_mtime = 0
-        
+
         try:
-            for filename in os.listdir(output_dir):
-                if filename.lower().endswith(".mkv"):
-                    filepath = os.path.join(output_dir, filename)
+            with os.scandir(self.args.output_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(MKV_SUFFIXES):
+                        continue
                     try:
-                        mtime = os.path.getmtime(filepath)
-                        if mtime > latest_mtime:
-                            latest_mtime = mtime
-                            latest_file = filepath
+                        mtime = entry.stat().st_mtime
                     except FileNotFoundError:
                         continue
+                    if mtime > latest_mtime:
+                        latest_mtime = mtime
+                        latest_file = entry.path
         except FileNotFoundError:
             return None
-        
+
         return latest_file
 
     def start_recording(self):
         """主录制循环"""
+        backoff = 1
         while not self.stop_event.is_set():
+            started = time.monotonic()
             try:
                 self._single_recording_cycle()
-                
-                if self.restart_event.is_set():
-                    self.restart_event.clear()
-                    continue
-                break
-                
+
+                if not self.restart_event.is_set():
+                    break
+                self.restart_event.clear()
+
             except Exception as e:
                 logging.error(f"录制循环异常: {str(e)}")
-                self.restart_event.set()
+
+            # 运行时间过短说明FFmpeg持续失败（如摄像头离线），指数退避后再重启
+            if time.monotonic() - started < RESTART_MIN_UPTIME:
+                delay = min(self.args.max_backoff, backoff) + random.random()
+                logging.info(f"{delay:.1f}秒后重启FFmpeg")
+                self.stop_event.wait(delay)
+                backoff *= 2
+            else:
+                backoff = 1
 
     def _single_recording_cycle(self):
         """单个录制周期"""
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.current_file = os.path.join(
-            self.args.output_dir, f"{timestamp}.mkv"
-        )
+        # 分片文件名由FFmpeg决定，等待文件监控上报
+        self.current_file = None
+        self.check_state = (time.monotonic(), 0)
         os.makedirs(self.args.output_dir, exist_ok=True)
 
-        cmd = [
-            self.args.ffmpeg_path,
-            "-hide_banner", "-nostats" if self.args.nostats else "",
-            "-rtsp_transport", self.args.rtsp_transport,
-            "-i", self.args.rtsp_url,
-            "-c", "copy",
-            "-f", "segment", "-reset_timestamps", "1", "-strftime", "1",
-            "-segment_time", str(self.args.segment_duration),
-            "-segment_format", "mkv",
-            os.path.join(self.args.output_dir, "%Y-%m-%d_%H-%M-%S.mkv"),
-        ]
+        # 清除上次的分片列表，确保列表中只有本次FFmpeg完成的分片
+        try:
+            os.remove(self.segment_list)
+        except FileNotFoundError:
+            pass
+
+        # stderr由排空线程持续读取，不会因无人读取的控制台管道写满而阻塞FFmpeg；
+        # 开启nostats且未指定日志文件时直接丢弃
+        if self.args.nostats and not self.args.ffmpeg_log:
+            stderr = subprocess.DEVNULL
+        else:
+            stderr = subprocess.PIPE
+
+        creationflags = 0
+        if sys.platform == "win32":
+            # 独立进程组，控制台信号只发送给FFmpeg
+            creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
 
         self.process = subprocess.Popen(
-            cmd,
+            self.cmd,
             stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
             cwd=script_dir,
+            creationflags=creationflags,
         )
+        if self.process.stderr:
+            threading.Thread(
+                target=self._drain_stderr, args=(self.process.stderr,),
+                daemon=True,
+            ).start()
 
-        monitor_thread = threading.Thread(target=self._monitor_process)
-        monitor_thread.start()
+        if self.ffmpeg_cpus:
+            # 在启动后设置而非preexec_fn：多线程下preexec_fn并不安全，且Windows不支持
+            try:
+                set_cpu_affinity(self.process.pid, self.ffmpeg_cpus)
+            except OSError as e:
+                logging.warning(f"无法设置FFmpeg的CPU亲和性: {str(e)}")
 
-        while True:
-            return_code = self.process.poll()
-            
-            if self.restart_event.is_set():
-                logging.info("收到重启信号，终止进程中...")
-                self._terminate_ffmpeg()
-                break
-                
-            if return_code is not None:
-                self._handle_exit_code(return_code)
-                break
-                
-            if self.stop_event.is_set():
-                self._terminate_ffmpeg()
-                break
-                
-            time.sleep(1)
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        pidfd = self._open_pidfd(self.process)
+        if pidfd is not None:
+            # 进程退出时pidfd可读，与唤醒信号一同等待
+            selector.register(pidfd, selectors.EVENT_READ)
+        else:
+            waiter_thread = threading.Thread(
+                target=self._wait_process, args=(self.process,), daemon=True
+            )
+            waiter_thread.start()
+
+        monitor = self._monitor_process()
+        try:
+            timeout = next(monitor, None)
+            while True:
+                # 阻塞直到进程退出、收到停止/重启/新分片信号或监控到期
+                selector.select(timeout)
+                self._drain_wakeup()
+
+                return_code = self.process.poll()
+
+                if self.restart_event.is_set():
+                    logging.info("收到重启信号，终止进程中...")
+                    self._terminate_ffmpeg()
+                    break
 
-        monitor_thread.join(timeout=30)
+                if return_code is not None:
+                    self._handle_exit_code(return_code)
+                    break
+
+                if self.stop_event.is_set():
+                    self._terminate_ffmpeg()
+                    break
+
+                timeout = next(monitor, None)
+        except BaseException:
+            # 监控或主循环出错时同样要结束本周期的FFmpeg，避免重启后两个实例同时录制
+            self._terminate_ffmpeg()
+            raise
+        finally:
+            monitor.close()
+            selector.close()
+            if pidfd is not None:
+                os.close(pidfd)
+
+    def _open_pidfd(self, process):
+        """获取进程的pidfd（Linux 5.3+），不支持时返回None"""
+        if not hasattr(os, "pidfd_open"):
+            return None
+        try:
+            return os.pidfd_open(process.pid)
+        except OSError:
+            return None
+
+    def _wait_process(self, process):
+        """等待FFmpeg进程退出并唤醒录制主循环（无pidfd时使用）"""
+        process.wait()
+        self._wakeup()
+
+    def wakeup_fileno(self):
+        """唤醒录制主循环的文件描述符（供signal.set_wakeup_fd使用）"""
+        return self._wake_w.fileno()
+
+    def _wakeup(self):
+        """唤醒录制主循环"""
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            # 缓冲区已满说明已有未处理的唤醒
+            pass
+
+    def _drain_wakeup(self):
+        """清空唤醒信号"""
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _request_restart(self):
+        """请求重启FFmpeg"""
+        self.restart_event.set()
+        self._wakeup()
+
+    def stop(self):
+        """请求停止录制"""
+        self.stop_event.set()
+        self._wakeup()
 
     def _monitor_process(self):
-        """监控文件写入状态"""
-        start_time = time.time()
-        file_created = False
-        
-        while not self.stop_event.is_set() and not self.restart_event.is_set():
-            with self.lock:
-                target_file = self.current_file
-                last_check = self.last_check_time
+        """监控文件写入状态
 
-            if not target_file:
-                time.sleep(1)
-                continue
+        作为生成器由录制主循环驱动，yield下一次检查前的等待秒数；
+        新分片、停止或重启信号会提前唤醒主循环并推进监控。
+        """
+        start_time = time.monotonic()
+        started_at = time.time()  # 用于与文件mtime比较
+        segment_list = SegmentListReader(self.segment_list)
+        finished = set()
 
-            # 检查文件是否存在
-            if not os.path.exists(target_file):
-                # 尝试查找最新的mkv文件
-                latest_file = self.find_latest_mkv()
-                if latest_file:
-                    logging.info(f"检测到更最新的文件: {latest_file}")
-                    with self.lock:
-                        self.current_file = latest_file
-                        self.last_check_time = time.time()
-                        self.last_size = os.path.getsize(latest_file)
-                    continue
-                else:
-                    if time.time() - start_time > self.args.file_timeout:
+        try:
+            while not self.stop_event.is_set() and not self.restart_event.is_set():
+                target_file = self.current_file
+                last_check, last_size = self.check_state
+
+                if not target_file:
+                    if time.monotonic() - start_time > self.args.file_timeout:
+                        # 文件监控未上报（如polling间隔较长），回退到目录扫描
+                        latest_file = self.find_latest_mkv()
+                        try:
+                            is_new = (latest_file and
+                                      os.stat(latest_file).st_mtime >= started_at)
+                        except FileNotFoundError:
+                            is_new = False
+                        if is_new:
+                            logging.info(f"检测到更最新的文件: {latest_file}")
+                            self.current_file = latest_file
+                            self.check_state = (time.monotonic(), 0)
+                            continue
                         logging.error("初始文件创建超时")
-                        self.restart_event.set()
-                    time.sleep(1)
+                        self._request_restart()
+                    yield 1
                     continue
 
-            # 检查文件增长
-            try:
-                current_size = os.path.getsize(target_file)
-                if current_size > self.last_size:
-                    self.last_size = current_size
-                    with self.lock:
-                        self.last_check_time = time.time()
-                else:
-                    # 检查是否有更新的文件
+                # 一次stat同时获取文件是否存在及其大小
+                try:
+                    current_size = os.stat(target_file).st_size
+                except FileNotFoundError:
+                    current_size = None
+
+                if current_size is None:
+                    # 尝试查找最新的mkv文件
                     latest_file = self.find_latest_mkv()
-                    if latest_file and latest_file != target_file:
-                        logging.info(f"检测到更新的文件，切换至: {latest_file}")
-                        with self.lock:
-                            self.current_file = latest_file
-                            self.last_check_time = time.time()
-                            self.last_size = os.path.getsize(latest_file)
+                    if latest_file:
+                        logging.info(f"检测到更最新的文件: {latest_file}")
+                        self.current_file = latest_file
+                        self.check_state = (time.monotonic(), 0)
+                        continue
+                    else:
+                        if time.monotonic() - start_time > self.args.file_timeout:
+                            logging.error("初始文件创建超时")
+                            self._request_restart()
+                        yield 1
                         continue
-                    elif time.time() - self.last_check_time > self.args.timeout:
+
+                # 检查文件增长
+                if current_size > last_size:
+                    self.check_state = (time.monotonic(), current_size)
+                else:
+                    # 由FFmpeg的分片列表判断该分片是否已经写完
+                    finished.update(segment_list.read_finished())
+                    if os.path.basename(target_file) in finished:
+                        logging.info(f"分片已完成: {target_file}")
+                        # 等待文件监控上报新分片，重新计算创建超时
+                        if self.current_file == target_file:
+                            self.current_file = None
+                        start_time = time.monotonic()
+                        started_at = time.time()
+                        continue
+                    elif time.monotonic() - last_check > self.args.timeout:
                         logging.error("文件写入停滞超时")
-                        self.restart_event.set()
-            except FileNotFoundError:
-                if file_created:
-                    logging.error("文件意外消失")
-                    self.restart_event.set()
+                        self._request_restart()
 
-            time.sleep(self.args.monitor_interval)
+                yield self.args.monitor_interval
+
+        finally:
+            segment_list.close()
+
+    def switch_file(self, filepath):
+        """切换当前监控的分片文件并唤醒录制主循环"""
+        self.current_file = filepath
+        # 新分片从0开始增长，不能沿用上一个分片的大小
+        self.check_state = (time.monotonic(), 0)
+        self._wakeup()
 
     def _handle_exit_code(self, code):
         """处理进程退出码"""
@@ -225,7 +772,7 @@ class FFmpegRecorder:
                     self.process.wait(timeout=15)
                 
                 if sys.platform == "win32":
-                    self.process.send_signal(signal.CTRL_C_EVENT)
+                    self.process.send_signal(signal.CTRL_BREAK_EVENT)
                 else:
                     self.process.send_signal(signal.SIGINT)
 
@@ -242,18 +789,58 @@ class FFmpegRecorder:
             except Exception as e:
                 logging.error(f"终止进程失败: {str(e)}")
 
-    def __del__(self):
-        if hasattr(self, "observer"):
-            self.observer.stop()
-            self.observer.join()
+    def close(self):
+        """停止文件监控"""
+        self._finalizer()
+
+class CleanupEventHandler(FileSystemEventHandler):
+    def __init__(self, cleaner):
+        super().__init__()
+        self.cleaner = cleaner
+
+    def on_closed(self, event):
+        """分片写入完成，加入索引"""
+        if not event.is_directory and event.src_path.endswith(MKV_SUFFIXES):
+            self.cleaner.add_file(event.src_path)
+
+    def on_created(self, event):
+        """新文件（polling模式下没有关闭事件），加入索引"""
+        if not event.is_directory and event.src_path.endswith(MKV_SUFFIXES):
+            self.cleaner.add_file(event.src_path)
+
+    def on_deleted(self, event):
+        """文件被删除，移出索引"""
+        if not event.is_directory and event.src_path.endswith(MKV_SUFFIXES):
+            self.cleaner.remove_file(event.src_path)
+
+    def on_overflow(self):
+        """监控事件丢失，索引已不可信"""
+        self.cleaner.invalidate_index()
+
+    def on_moved(self, event):
+        """文件被移动，更新索引"""
+        if event.is_directory:
+            return
+        if event.src_path.endswith(MKV_SUFFIXES):
+            self.cleaner.remove_file(event.src_path)
+        if event.dest_path.endswith(MKV_SUFFIXES):
+            self.cleaner.add_file(event.dest_path)
 
 class CleanupManager:
     def __init__(self, args):
         self.args = args
         self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self._index = []  # 按创建时间排序的 (ctime, path, size)
+        self._entries = {}  # path -> 索引项
+        self._total_size = 0
+        self._indexed = False
+        self._pending = None  # 重建索引期间收到的 (path, 索引项或None)
+        self._dir_fd = None
 
     def start_cleanup(self):
         """清理线程主循环"""
+        lower_thread_priority()
         while not self.stop_event.is_set():
             try:
                 self._cleanup_cycle()
@@ -261,59 +848,170 @@ class CleanupManager:
             except Exception as e:
                 logging.error(f"清理失败: {str(e)}")
 
+    def add_file(self, filepath):
+        """将文件加入（或刷新）索引"""
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            self.remove_file(filepath)
+            return
+
+        with self.lock:
+            previous = self._index[-1][1] if self._index else None
+            entry = (stat.st_ctime, filepath, stat.st_size)
+            self._insert_entry(entry)
+            if self._pending is not None:
+                self._pending.append((filepath, entry))
+            rolled_over = (
+                previous not in (None, filepath) and self._index[-1] is entry
+            )
+
+        # 有了更新的分片，说明之前最新的分片已写完，刷新其大小
+        if rolled_over:
+            self.add_file(previous)
+
+    def invalidate_index(self):
+        """标记索引失效，下次清理时全量重建"""
+        self._indexed = False
+
+    def remove_file(self, filepath):
+        """将文件移出索引"""
+        with self.lock:
+            self._remove_entry(filepath)
+            if self._pending is not None:
+                self._pending.append((filepath, None))
+
+    def _insert_entry(self, entry):
+        """插入或替换索引项（需持有锁）"""
+        self._remove_entry(entry[1])
+        bisect.insort(self._index, entry)
+        self._entries[entry[1]] = entry
+        self._total_size += entry[2]
+
+    def _remove_entry(self, filepath):
+        """移除索引项（需持有锁）"""
+        entry = self._entries.pop(filepath, None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self._index, entry)
+        del self._index[i]
+        self._total_size -= entry[2]
+
+    def _rebuild_index(self):
+        """全量扫描目录重建索引
+
+        扫描期间文件监控上报的变化先记录下来，替换索引后再重放，避免丢失。
+        空文件同样加入索引，由清理流程删除（跳过可能刚创建的最新分片）。
+        """
+        with self.lock:
+            self._pending = []
+            # 先标记，扫描期间若收到invalidate_index()则保持失效
+            self._indexed = True
+
+        files = []
+        try:
+            with os.scandir(self.args.output_dir) as entries:
+                mkv_entries = [
+                    e for e in entries if e.name.endswith(MKV_SUFFIXES)
+                ]
+
+            for entry in mkv_entries:
+                filepath = entry.path
+                try:
+                    stat = entry.stat()
+                    files.append((stat.st_ctime, filepath, stat.st_size))
+                except Exception as e:
+                    logging.warning(f"无法处理文件 {os.path.basename(filepath)}: {str(e)}")
+
+            # 按创建时间排序（旧文件在前）
+            files.sort()
+        except BaseException:
+            with self.lock:
+                self._pending = None
+                self._indexed = False
+            raise
+
+        with self.lock:
+            self._index = files
+            self._entries = {entry[1]: entry for entry in files}
+            self._total_size = sum(entry[2] for entry in files)
+            for filepath, entry in self._pending:
+                if entry is None:
+                    self._remove_entry(filepath)
+                else:
+                    self._insert_entry(entry)
+            self._pending = None
+
     def _cleanup_cycle(self):
         """执行清理操作"""
-        files = []
-        total_size = 0
+        # 持有目录fd，删除时只需解析文件名而非完整路径
+        if os.unlink in os.supports_dir_fd:
+            self._dir_fd = os.open(
+                self.args.output_dir, os.O_RDONLY | os.O_DIRECTORY
+            )
+        try:
+            self._purge()
+        finally:
+            if self._dir_fd is not None:
+                os.close(self._dir_fd)
+                self._dir_fd = None
 
-        for filename in os.listdir(self.args.output_dir):
-            filepath = os.path.join(self.args.output_dir, filename)
-            if not filename.lower().endswith(".mkv"):
-                continue
+    def _purge(self):
+        """按索引删除空文件及超出限制的旧文件"""
+        if not self._indexed:
+            self._rebuild_index()
+        elif self._index:
+            # 最新的文件可能仍在写入，刷新其大小
+            self.add_file(self._index[-1][1])
 
-            try:
-                stat = os.stat(filepath)
-                if stat.st_size == 0:  # 删除空文件
-                    os.remove(filepath)
-                    logging.info(f"删除空文件: {filename}")
-                    continue
+        with self.lock:
+            # 删除空文件（最新的文件可能刚创建，跳过）
+            for entry in self._index[:-1]:
+                if entry[2] == 0:
+                    self._remove_entry(entry[1])
+                    self._delete_file(entry[1], "空文件")
 
-                file_time = datetime.fromtimestamp(stat.st_ctime)
-                files.append((file_time, filepath, stat.st_size))
-                total_size += stat.st_size
-            except Exception as e:
-                logging.warning(f"无法处理文件 {filename}: {str(e)}")
+            # 计算需要清理的最旧文件数量，一次性切片移出索引
+            excess = max(0, len(self._index) - self.args.max_files)
+            remaining = self._total_size - sum(e[2] for e in self._index[:excess])
+            count = excess
+            while count < len(self._index) and remaining > self.args.max_size:
+                remaining -= self._index[count][2]
+                count += 1
 
-        # 按创建时间排序（旧文件在前）
-        files.sort(key=lambda x: x[0])
+            expired = self._index[:count]
+            del self._index[:count]
+            for entry in expired:
+                del self._entries[entry[1]]
+            self._total_size = remaining
 
-        # 清理超过数量限制
-        while len(files) > self.args.max_files:
-            oldest = files.pop(0)
-            try:
-                os.remove(oldest[1])
-                total_size -= oldest[2]
-                logging.info(f"删除旧文件（数量限制）: {os.path.basename(oldest[1])}")
-            except Exception as e:
-                logging.error(f"删除失败 {oldest[1]}: {str(e)}")
+        for i, entry in enumerate(expired):
+            reason = "数量限制" if i < excess else "大小限制"
+            self._delete_file(entry[1], f"旧文件（{reason}）")
 
-        # 清理超过大小限制
-        while total_size > self.args.max_size and files:
-            oldest = files.pop(0)
-            try:
-                os.remove(oldest[1])
-                total_size -= oldest[2]
-                logging.info(f"删除旧文件（大小限制）: {os.path.basename(oldest[1])}")
-            except Exception as e:
-                logging.error(f"删除失败 {oldest[1]}: {str(e)}")
+    def _delete_file(self, filepath, reason):
+        """删除文件，失败时在下次清理前重建索引"""
+        try:
+            self._unlink(filepath)
+            logging.info(f"删除{reason}: {os.path.basename(filepath)}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"删除失败 {filepath}: {str(e)}")
+            self._indexed = False
+
+    def _unlink(self, filepath):
+        """删除输出目录下的文件"""
+        if self._dir_fd is None:
+            os.remove(filepath)
+        else:
+            os.unlink(os.path.basename(filepath), dir_fd=self._dir_fd)
 
 def signal_handler(sig, frame, recorder, cleaner):
-    """处理系统信号"""
+    """处理系统信号：只发出停止请求，由录制主循环终止FFmpeg"""
     logging.info("收到终止信号，正在关闭...")
-    recorder.stop_event.set()
+    recorder.stop()
     cleaner.stop_event.set()
-    recorder._terminate_ffmpeg()
-    sys.exit(0)
 
 def main():
     # 切换工作目录
@@ -344,7 +1042,14 @@ def main():
                       help="文件监控检查间隔（秒）")
     parser.add_argument("--cleanup_interval", type=int, default=3600,
                       help="清理任务执行间隔（秒）")
+    parser.add_argument("--max_backoff", type=int, default=60,
+                      help="FFmpeg连续失败时的最大重启间隔（秒）")
     
+    # 文件监控
+    parser.add_argument("--fs_watcher", default="auto",
+                      choices=["auto", "inotify", "polling"],
+                      help="文件监控方式（auto在网络文件系统上使用polling）")
+
     # 存储限制
     parser.add_argument("--max_files", type=int, default=256,
                       help="最大保留文件数量")
@@ -362,6 +1067,13 @@ def main():
                       help="FFmpeg loglevel")
     parser.add_argument("--nostats", type=bool, default=False,
                       help="FFmpeg nostats")
+    parser.add_argument("--pin_cpu", action="store_true",
+                      help="将Python固定在一个核心，FFmpeg使用其余核心")
+    parser.add_argument("--ffmpeg_log", default="",
+                      help="FFmpeg日志文件，按大小轮转（为空则并入本程序日志，"
+                           "此时开启nostats会丢弃FFmpeg输出）")
+    parser.add_argument("--ffmpeg_log_size", type=int, default=10*1024**2,
+                      help="FFmpeg日志文件轮转大小（字节）")
     parser.add_argument("--rtsp_transport", default="tcp",
                       choices=["tcp", "udp", "http"],
                       help="RTSP传输协议")
@@ -374,8 +1086,14 @@ def main():
 
     recorder = FFmpegRecorder(args)
     cleaner = CleanupManager(args)
+    recorder.observer.schedule(
+        CleanupEventHandler(cleaner),
+        args.output_dir,
+        recursive=False,
+    )
 
-    # 注册信号处理
+    # 注册信号处理；信号到达时同时写入唤醒fd，保证阻塞中的select立即返回
+    signal.set_wakeup_fd(recorder.wakeup_fileno(), warn_on_full_buffer=False)
     if sys.platform != "win32":
         signal.signal(signal.SIGTERM,
             lambda s, f: signal_handler(s, f, recorder, cleaner))
@@ -390,11 +1108,9 @@ def main():
     try:
         recorder.start_recording()
     finally:
-        recorder.stop_event.set()
+        recorder.stop()
         cleaner.stop_event.set()
-        if hasattr(recorder, "observer"):
-            recorder.observer.stop()
-            recorder.observer.join()
+        recorder.close()
         logging.info("服务已完全停止")
 
 if __name__ == "__main__":